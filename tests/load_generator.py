@@ -5,21 +5,24 @@ BACnet Event Server - Load Generator
 Generates test events for KurrentDB to stress test the BACnet Event Server.
 
 Usage:
-    python load_generator.py [rate] [duration_seconds]
+    python load_generator.py [rate] [duration_seconds] [batch_size] [producers]
     
     rate: messages per second (default: 100)
     duration_seconds: how long to run (default: indefinite)
+    batch_size: events per append_to_stream call (default: 50)
+    producers: concurrent producer tasks sharing the rate (default: 1)
 
 Example:
     python load_generator.py 100 3600  # 100 msg/s for 1 hour
 """
 
 import asyncio
+import collections
+import itertools
 import json
 import random
 import time
 import sys
-from datetime import datetime, timezone
 from typing import Dict, List, Tuple, Optional
 
 try:
@@ -30,6 +33,18 @@ except ImportError:
     subprocess.check_call([sys.executable, "-m", "pip", "install", "esdbclient"])
     from esdbclient import EventStoreDBClient, NewEvent
 
+# Optional: orjson serializes considerably faster than the stdlib json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional: numpy draws random numbers in bulk far cheaper than per-call random
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # Object type distribution
 OBJECT_TYPES: List[Tuple[str, float]] = [
     ("analog-input", 0.40),
@@ -46,6 +61,28 @@ MESSAGE_TYPES: List[Tuple[str, float]] = [
     ("ObjectDelete", 0.02)
 ]
 
+# Highest valid BACnet object instance (4194303 is reserved)
+MAX_INSTANCE = 4194302
+
+# Objects are only deleted while more than this many exist
+MIN_OBJECTS = 20
+
+# Number of random draws generated per numpy call
+RANDOM_POOL_SIZE = 65536
+
+# Number of (message type, object type) pairs drawn per random.choices call
+TYPE_POOL_SIZE = 4096
+
+_MSG_NAMES = [name for name, _ in MESSAGE_TYPES]
+_MSG_CUM_WEIGHTS = list(itertools.accumulate(w for _, w in MESSAGE_TYPES))
+_OBJ_NAMES = [name for name, _ in OBJECT_TYPES]
+_OBJ_CUM_WEIGHTS = list(itertools.accumulate(w for _, w in OBJECT_TYPES))
+
+# Object keys pack the index into OBJECT_TYPES above a 29-bit instance number
+_INSTANCE_BITS = 29
+_INSTANCE_MASK = (1 << _INSTANCE_BITS) - 1
+_OBJ_TYPE_ID = {name: i for i, name in enumerate(_OBJ_NAMES)}
+
 # BACnet units (common examples)
 UNITS = {
     "analog-input": [(169, "kWh"), (95, ""), (62, "degC"), (91, "percent")],
@@ -55,17 +92,92 @@ UNITS = {
     "multi-state-value": [(95, "")]
 }
 
+# Precomputed objectName prefix per object type
+_NAME_PREFIX = {t: "Test_" + t.replace('-', '_') + "_" for t, _ in OBJECT_TYPES}
+
+# Pre-rendered ValueUpdate JSON for the stdlib json fallback; only the
+# variable fields are spliced in
+_VU_FORMAT = (
+    b'{"messageType":"ValueUpdate","timestamp":%s,"sourceId":"load-generator",'
+    b'"payload":{"objectType":%s,"objectInstance":%d,"presentValue":%s,'
+    b'"quality":%s,"statusFlags":{"inAlarm":%s,"fault":%s,'
+    b'"overridden":false,"outOfService":false}}}'
+)
+_JSON_OBJECT_TYPE = {t: b'"' + t.encode() + b'"' for t, _ in OBJECT_TYPES}
+_JSON_QUALITY = {"good": b'"good"', "uncertain": b'"uncertain"'}
+_JSON_BOOL = {False: b"false", True: b"true"}
+
+
+def dumps(message: dict) -> bytes:
+    """Serialize message to UTF-8 JSON, preferring orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(message)
+    return json.dumps(message).encode('utf-8')
+
 
 class LoadGenerator:
     """Generates test load for KurrentDB"""
     
     def __init__(self, connection_string: str = "esdb://localhost:2113?tls=false",
-                 target_rate: int = 100):
+                 target_rate: int = 100, batch_size: int = 50,
+                 max_flush_delay: float = 0.05, max_queued: int = 8,
+                 producers: int = 1):
         self.connection_string = connection_string
         self.target_rate = target_rate
+        self.batch_size = batch_size
+        self.max_flush_delay = max_flush_delay
+        self.max_queued = max_queued
+        # Generation is single-threaded and sending is already decoupled by
+        # the queue; extra producers only keep generating while another one
+        # is blocked on a full queue
+        self.producers = producers
         self.client: Optional[EventStoreDBClient] = None
-        self.objects: Dict[Tuple[str, int], dict] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        # Pacing and stats state shared by all producer tasks
+        self._next_deadline = 0.0
+        self._stats_countdown = 0
+        self._pending: List[NewEvent] = []
+        # Freelist of emptied batch lists, recycled instead of reallocated
+        self._free_batches: collections.deque = collections.deque()
+        self._pending_since = 0.0
+        self.objects: Dict[int, dict] = {}
+        # Keys of self.objects for O(1) random picks; obj["idx"] is the position
+        self.object_keys: List[int] = []
+        self._can_delete = False  # len(object_keys) > MIN_OBJECTS
+        self._timestamp = ""
+        self._timestamp_json = b""
+        self._timestamp_at = 0.0
+        self._timestamp_sec = -1
+        self._timestamp_prefix = ""
+        self.refresh_timestamp()
+        # Reused ValueUpdate message; only the variable fields change per call
+        self._vu_flags = {
+            "inAlarm": False,
+            "fault": False,
+            "overridden": False,
+            "outOfService": False
+        }
+        self._vu_payload = {
+            "objectType": None,
+            "objectInstance": 0,
+            "presentValue": None,
+            "quality": "good",
+            "statusFlags": self._vu_flags
+        }
+        self._vu_template = {
+            "messageType": "ValueUpdate",
+            "timestamp": None,
+            "sourceId": "load-generator",
+            "payload": self._vu_payload
+        }
+        self._rng = numpy.random.default_rng() if numpy is not None else None
+        self._gauss_pool: List[float] = []
+        self._gauss_idx = 0
+        self._type_pool: List[Tuple[str, str]] = []
+        self._type_idx = 0
         self.next_instance: Dict[str, int] = {}
+        self._sent = 0  # Mirrored into stats["sent"] by print_stats
         self.stats = {
             "sent": 0,
             "errors": 0,
@@ -87,50 +199,82 @@ class LoadGenerator:
             print(f"[LOADGEN] Connection failed: {e}")
             return False
     
-    def weighted_choice(self, choices: List[Tuple[str, float]]) -> str:
-        """Select item based on weights"""
-        r = random.random()
-        cumulative = 0.0
-        for choice, weight in choices:
-            cumulative += weight
-            if r <= cumulative:
-                return choice
-        return choices[-1][0]
+    def refresh_timestamp(self):
+        """Refresh the message timestamp if it is more than 1 ms old"""
+        now = time.monotonic()
+        if now - self._timestamp_at < 0.001:
+            return
+        self._timestamp_at = now
+        
+        # ISO 8601 UTC; the date/time part is only reformatted once a second
+        ns = time.time_ns()
+        sec, frac = divmod(ns, 1_000_000_000)
+        if sec != self._timestamp_sec:
+            self._timestamp_sec = sec
+            self._timestamp_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        self._timestamp = "%s.%06dZ" % (self._timestamp_prefix, frac // 1000)
+        self._timestamp_json = b'"%s"' % self._timestamp.encode()
+    
+    def _next_gauss(self) -> float:
+        """Draw from N(0, 1), refilling the pool in bulk when exhausted"""
+        if self._rng is None:
+            return random.gauss(0, 1.0)
+        i = self._gauss_idx
+        if i >= len(self._gauss_pool):
+            self._gauss_pool = self._rng.standard_normal(RANDOM_POOL_SIZE).tolist()
+            i = 0
+        self._gauss_idx = i + 1
+        return self._gauss_pool[i]
+    
+    def _next_types(self) -> Tuple[str, str]:
+        """Draw (message type, object type), refilling the pool in bulk"""
+        i = self._type_idx
+        if i >= len(self._type_pool):
+            self._type_pool = list(zip(
+                random.choices(_MSG_NAMES, cum_weights=_MSG_CUM_WEIGHTS, k=TYPE_POOL_SIZE),
+                random.choices(_OBJ_NAMES, cum_weights=_OBJ_CUM_WEIGHTS, k=TYPE_POOL_SIZE)
+            ))
+            i = 0
+        self._type_idx = i + 1
+        return self._type_pool[i]
     
     def get_next_instance(self, obj_type: str) -> int:
-        """Get next instance number for object type"""
+        """Get next instance number for object type, wrapping at MAX_INSTANCE"""
         if obj_type not in self.next_instance:
             self.next_instance[obj_type] = 1
         instance = self.next_instance[obj_type]
-        self.next_instance[obj_type] += 1
+        # Wrapping keeps instances within BACnet range and below the
+        # object-key type bits; a reused live instance is redefined in place
+        self.next_instance[obj_type] = instance + 1 if instance < MAX_INSTANCE else 1
         return instance
     
     def generate_object_definition(self, obj_type: str, instance: int) -> dict:
         """Generate ObjectDefinition message"""
-        units = random.choice(UNITS.get(obj_type, [(95, "")]))
+        choices = UNITS.get(obj_type, [(95, "")])
+        units = choices[int(random.random() * len(choices))]
         
         if obj_type.startswith("analog"):
             value_type = "real"
-            initial_value = random.uniform(0, 100)
-            cov_increment = random.choice([0.1, 0.5, 1.0])
+            initial_value = random.random() * 100
+            cov_increment = (0.1, 0.5, 1.0)[int(random.random() * 3)]
         elif obj_type.startswith("binary"):
             value_type = "boolean"
-            initial_value = random.choice([True, False])
+            initial_value = random.random() < 0.5
             cov_increment = None
         else:  # multi-state
             value_type = "unsigned"
-            initial_value = random.randint(1, 5)
+            initial_value = 1 + int(random.random() * 5)
             cov_increment = None
         
         msg = {
             "messageType": "ObjectDefinition",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": self._timestamp,
             "sourceId": "load-generator",
             "payload": {
                 "objectType": obj_type,
                 "objectInstance": instance,
-                "objectName": f"Test_{obj_type.replace('-', '_')}_{instance}",
-                "description": f"Load test object {instance}",
+                "objectName": _NAME_PREFIX[obj_type] + str(instance),
+                "description": "Load test object " + str(instance),
                 "presentValueType": value_type,
                 "units": units[0],
                 "unitsText": units[1],
@@ -142,32 +286,46 @@ class LoadGenerator:
             msg["payload"]["covIncrement"] = cov_increment
         
         # Store object for later updates
-        self.objects[(obj_type, instance)] = {
+        key = (_OBJ_TYPE_ID[obj_type] << _INSTANCE_BITS) | instance
+        existing = self.objects.get(key)
+        if existing:
+            idx = existing["idx"]
+        else:
+            idx = len(self.object_keys)
+            self.object_keys.append(key)
+            self._can_delete = idx >= MIN_OBJECTS
+        self.objects[key] = {
             "type": obj_type,
             "instance": instance,
             "value_type": value_type,
-            "last_value": initial_value
+            "last_value": initial_value,
+            "idx": idx
         }
         
         return msg
     
-    def generate_value_update(self, obj_type: str, instance: int) -> dict:
-        """Generate ValueUpdate message"""
-        obj = self.objects.get((obj_type, instance))
+    def generate_value_update(self, key: int) -> dict:
+        """Generate ValueUpdate message for the object with the given key
+        
+        The returned dict is shared and overwritten by the next call, so it
+        must be serialized before another ValueUpdate is generated.
+        """
+        obj = self.objects.get(key)
         if not obj:
-            return self.generate_object_definition(obj_type, instance)
+            return self.generate_object_definition(
+                _OBJ_NAMES[key >> _INSTANCE_BITS], key & _INSTANCE_MASK)
         
         # Generate new value based on type
         if obj["value_type"] == "real":
             # Random walk from last value
-            delta = random.gauss(0, 1.0)
+            delta = self._next_gauss()
             new_value = max(0, min(100, obj["last_value"] + delta))
         elif obj["value_type"] == "boolean":
             # 10% chance to flip
             new_value = not obj["last_value"] if random.random() < 0.1 else obj["last_value"]
         else:  # unsigned (multi-state)
             # Random state 1-5
-            new_value = random.randint(1, 5)
+            new_value = 1 + int(random.random() * 5)
         
         obj["last_value"] = new_value
         
@@ -175,100 +333,192 @@ class LoadGenerator:
         in_alarm = random.random() < 0.02
         fault = random.random() < 0.01
         
-        return {
-            "messageType": "ValueUpdate",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "sourceId": "load-generator",
-            "payload": {
-                "objectType": obj_type,
-                "objectInstance": instance,
-                "presentValue": new_value,
-                "quality": "good" if not (in_alarm or fault) else "uncertain",
-                "statusFlags": {
-                    "inAlarm": in_alarm,
-                    "fault": fault,
-                    "overridden": False,
-                    "outOfService": False
-                }
-            }
-        }
+        payload = self._vu_payload
+        payload["objectType"] = obj["type"]
+        payload["objectInstance"] = obj["instance"]
+        payload["presentValue"] = new_value
+        payload["quality"] = "good" if not (in_alarm or fault) else "uncertain"
+        flags = self._vu_flags
+        flags["inAlarm"] = in_alarm
+        flags["fault"] = fault
+        
+        msg = self._vu_template
+        msg["timestamp"] = self._timestamp
+        return msg
+    
+    def encode_message(self, message: dict) -> bytes:
+        """Serialize message, splicing ValueUpdates into pre-rendered JSON
+        
+        orjson encodes the reused ValueUpdate template faster than splicing
+        in Python, so the pre-rendered layout is only used without orjson.
+        """
+        if orjson is not None or message is not self._vu_template:
+            return dumps(message)
+        
+        payload = self._vu_payload
+        flags = self._vu_flags
+        value = payload["presentValue"]
+        if value is True or value is False:
+            value_json = _JSON_BOOL[value]
+        else:
+            value_json = repr(value).encode()
+        return _VU_FORMAT % (
+            self._timestamp_json,
+            _JSON_OBJECT_TYPE[payload["objectType"]],
+            payload["objectInstance"],
+            value_json,
+            _JSON_QUALITY[payload["quality"]],
+            _JSON_BOOL[flags["inAlarm"]],
+            _JSON_BOOL[flags["fault"]]
+        )
     
-    def generate_object_delete(self, obj_type: str, instance: int) -> dict:
-        """Generate ObjectDelete message"""
+    def generate_object_delete(self, key: int) -> dict:
+        """Generate ObjectDelete message for the object with the given key"""
         # Remove from tracked objects
-        key = (obj_type, instance)
-        if key in self.objects:
-            del self.objects[key]
+        obj = self.objects.pop(key, None)
+        if obj:
+            # Swap-and-pop keeps object_keys dense without shifting
+            keys = self.object_keys
+            last = keys.pop()
+            self._can_delete = len(keys) > MIN_OBJECTS
+            if last != key:
+                keys[obj["idx"]] = last
+                self.objects[last]["idx"] = obj["idx"]
         
         return {
             "messageType": "ObjectDelete",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": self._timestamp,
             "sourceId": "load-generator",
             "payload": {
-                "objectType": obj_type,
-                "objectInstance": instance,
+                "objectType": _OBJ_NAMES[key >> _INSTANCE_BITS],
+                "objectInstance": key & _INSTANCE_MASK,
                 "reason": "load-test-cleanup"
             }
         }
     
     def generate_message(self) -> dict:
         """Generate a random message based on distribution"""
-        msg_type = self.weighted_choice(MESSAGE_TYPES)
-        obj_type = self.weighted_choice(OBJECT_TYPES)
+        msg_type, obj_type = self._next_types()
+        keys = self.object_keys
         
-        if msg_type == "ObjectDefinition":
+        # Fast path: update a random existing object (~90% of messages)
+        if msg_type == "ValueUpdate" and keys:
+            return self.generate_value_update(keys[int(random.random() * len(keys))])
+        
+        # Definitions, and the first object if none exist yet
+        if msg_type == "ObjectDefinition" or not keys:
             instance = self.get_next_instance(obj_type)
             return self.generate_object_definition(obj_type, instance)
         
-        elif msg_type == "ValueUpdate":
-            if not self.objects:
-                # Create first object if none exist
-                instance = self.get_next_instance(obj_type)
-                return self.generate_object_definition(obj_type, instance)
-            
-            # Update random existing object
-            obj_key = random.choice(list(self.objects.keys()))
-            return self.generate_value_update(obj_key[0], obj_key[1])
-        
-        else:  # ObjectDelete
-            if len(self.objects) > 20:  # Keep minimum objects
-                obj_key = random.choice(list(self.objects.keys()))
-                return self.generate_object_delete(obj_key[0], obj_key[1])
-            else:
-                # Not enough objects, send value update instead
-                if self.objects:
-                    obj_key = random.choice(list(self.objects.keys()))
-                    return self.generate_value_update(obj_key[0], obj_key[1])
-                else:
-                    instance = self.get_next_instance(obj_type)
-                    return self.generate_object_definition(obj_type, instance)
+        key = keys[int(random.random() * len(keys))]
+        if self._can_delete:  # Keep minimum objects
+            return self.generate_object_delete(key)
+        
+        # Not enough objects, send value update instead
+        return self.generate_value_update(key)
     
     async def send_message(self, message: dict) -> bool:
-        """Send message to KurrentDB"""
+        """Queue message for KurrentDB, flushing when the batch is due"""
         try:
-            event_data = json.dumps(message).encode('utf-8')
             event = NewEvent(
                 type=message["messageType"],
-                data=event_data
+                data=self.encode_message(message)
             )
-            
-            self.client.append_to_stream(
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"[LOADGEN] Error: {e}")
+            return False
+        
+        if not self._pending:
+            # Clock of the last timestamp refresh, read at most once per ms
+            self._pending_since = self._timestamp_at
+        self._pending.append(event)
+        
+        # Flush when the batch is full; _produce flushes batches that wait
+        # longer than max_flush_delay
+        if len(self._pending) >= self.batch_size:
+            return await self.flush()
+        return True
+    
+    async def flush(self) -> bool:
+        """Hand all pending events to the sender as a single batch"""
+        if not self._pending:
+            return True
+        
+        if self._queue is None:
+            events = self._pending
+            self._pending = self._free_batches.pop() if self._free_batches else []
+            return await self._append(events)
+        
+        # Serialize producers so batches are queued in the order they were
+        # swapped out, even while blocked on a full queue
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+            events = self._pending
+            self._pending = self._free_batches.pop() if self._free_batches else []
+            # Blocks while max_queued batches are waiting, applying backpressure
+            try:
+                await self._queue.put(events)
+            except asyncio.CancelledError:
+                # Put the batch back ahead of newer events so the final
+                # flush in run() still sends it
+                events.extend(self._pending)
+                self._pending = events
+                raise
+        return True
+    
+    async def _append(self, events: List[NewEvent]) -> bool:
+        """Append events to KurrentDB without blocking the event loop"""
+        try:
+            await asyncio.to_thread(
+                self.client.append_to_stream,
                 stream_name="energy-meters",
-                events=[event],
+                events=events,
                 current_version="any"
             )
-            
-            self.stats["sent"] += 1
-            self.stats["by_type"][message["messageType"]] += 1
-            return True
-            
+            success = True
         except Exception as e:
-            self.stats["errors"] += 1
+            self.stats["errors"] += len(events)
             print(f"[LOADGEN] Error: {e}")
-            return False
+            success = False
+        else:
+            self._sent += len(events)
+            for event in events:
+                self.stats["by_type"][event.type] += 1
+        
+        # The client is done with the batch; return the list to the freelist
+        events.clear()
+        self._free_batches.append(events)
+        return success
+    
+    async def _sender(self):
+        """Task appending queued batches to KurrentDB in order
+        
+        A single sender per stream keeps events in generation order, so a
+        ValueUpdate never lands before its object's ObjectDefinition. The
+        append itself runs in a thread, so the event loop never blocks.
+        """
+        while True:
+            events = await self._queue.get()
+            batches = 1
+            # Merge batches that queued up behind the last round-trip into
+            # one append; order is preserved and throughput keeps up
+            while not self._queue.empty():
+                more = self._queue.get_nowait()
+                events.extend(more)
+                more.clear()
+                self._free_batches.append(more)
+                batches += 1
+            try:
+                await self._append(events)
+            finally:
+                for _ in range(batches):
+                    self._queue.task_done()
     
     def print_stats(self):
         """Print current statistics"""
+        self.stats["sent"] = self._sent
         elapsed = time.time() - self.stats["start_time"]
         rate = self.stats["sent"] / elapsed if elapsed > 0 else 0
         
@@ -281,13 +531,58 @@ class LoadGenerator:
               f"ValUpd={self.stats['by_type']['ValueUpdate']}, "
               f"ObjDel={self.stats['by_type']['ObjectDelete']}")
     
+    async def _produce(self, interval: float, end_time: Optional[float],
+                       stats_interval: int):
+        """Producer task generating messages against the shared deadline"""
+        # Below 1 ms per message, work in chunks of ~1 ms worth of messages
+        # so the clock is read and the deadline advanced once per chunk
+        chunk = max(1, int(0.001 / interval))
+        chunk_interval = chunk * interval
+        
+        while True:
+            # Reserve the next slot on the shared deadline before generating,
+            # so the aggregate rate holds from the first message on
+            now = time.monotonic()
+            slot = self._next_deadline
+            if slot < now - 1.0:
+                # Fell more than a second behind; don't burst to catch up
+                slot = now
+            if end_time and slot >= end_time:
+                break
+            self._next_deadline = slot + chunk_interval
+            delay = slot - now
+            
+            # Flush a partial batch that is due, or would be by the time we
+            # wake up, rather than leave it waiting for the next message
+            if (self._pending and
+                    now + max(delay, 0.0) - self._pending_since >= self.max_flush_delay):
+                await self.flush()
+                delay = slot - time.monotonic()
+            
+            # Sleep only once we are more than 1 ms ahead of schedule
+            if delay > 0.001:
+                await asyncio.sleep(delay)
+            
+            # Generating and encoding never awaits, so producers can share
+            # generator state without a lock
+            self.refresh_timestamp()
+            for _ in range(chunk):
+                message = self.generate_message()
+                await self.send_message(message)
+            
+            # Print stats periodically
+            self._stats_countdown -= chunk
+            if self._stats_countdown <= 0:
+                self.print_stats()
+                self._stats_countdown += stats_interval
+    
     async def run(self, duration_seconds: Optional[int] = None):
         """Run the load generator"""
         if not self.connect():
             return
         
         interval = 1.0 / self.target_rate
-        end_time = time.time() + duration_seconds if duration_seconds else None
+        end_time = time.monotonic() + duration_seconds if duration_seconds else None
         stats_interval = self.target_rate * 10  # Print stats every ~10 seconds
         
         print(f"[LOADGEN] Starting at {self.target_rate} msg/s")
@@ -295,27 +590,27 @@ class LoadGenerator:
             print(f"[LOADGEN] Duration: {duration_seconds} seconds")
         print()
         
+        self._stats_countdown = stats_interval
+        
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._flush_lock = asyncio.Lock()
+        sender = asyncio.create_task(self._sender())
+        
         try:
-            while True:
-                if end_time and time.time() >= end_time:
-                    break
-                
-                start = time.time()
-                
-                message = self.generate_message()
-                await self.send_message(message)
-                
-                # Print stats periodically
-                if self.stats["sent"] % stats_interval == 0:
-                    self.print_stats()
-                
-                # Pace to target rate
-                elapsed = time.time() - start
-                if elapsed < interval:
-                    await asyncio.sleep(interval - elapsed)
-                    
+            self._next_deadline = time.monotonic()
+            await asyncio.gather(*(
+                self._produce(interval, end_time, stats_interval)
+                for _ in range(self.producers)
+            ))
         except KeyboardInterrupt:
             print("\n[LOADGEN] Interrupted by user")
+        finally:
+            await self.flush()
+            await self._queue.join()
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            self._queue = None
+            self._flush_lock = None
         
         print()
         print("[LOADGEN] Final Statistics:")
@@ -326,10 +621,13 @@ async def main():
     """Main entry point"""
     rate = int(sys.argv[1]) if len(sys.argv) > 1 else 100
     duration = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    producers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
     
     connection_string = "esdb://kurrentdb:2113?tls=false"
     
-    generator = LoadGenerator(connection_string, rate)
+    generator = LoadGenerator(connection_string, rate, batch_size,
+                              producers=producers)
     await generator.run(duration)
 
 